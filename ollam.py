@@ -1,21 +1,29 @@
-import json
+import asyncio
+import contextlib
+import hashlib
 import time
+import diskcache
+import httpx
+import ijson
 import ollama
+import orjson
 from pydantic import BaseModel, Field
-from typing import List
-import requests
-from requests.structures import CaseInsensitiveDict
+from typing import List, Optional
 from dotenv import load_dotenv
 import os
 from reddit_scraper import RedditSummarizer 
 
 load_dotenv()
 
+# MODEL_NAME = 'cnmoro/arcee-lite:q4_k_m'
+MODEL_NAME = 'technobyte/c4ai-command-r7b-12-2024:Q5_K_M'
+
 class Activity(BaseModel):
     location_name: str
     description: str = Field(..., min_length=50)
-    longitude: float = None
-    latitude: float = None
+    # Filled in after geocoding; the LLM output leaves them unset.
+    longitude: Optional[float] = None
+    latitude: Optional[float] = None
 
 class Day(BaseModel):
     day: int
@@ -26,21 +34,45 @@ class Itinerary(BaseModel):
     trip_duration: int
     itinerary: List[Day] 
 
+_ITINERARY_SCHEMA = Itinerary.model_json_schema()
+
 class TripDetails(BaseModel):
     destination: str
     duration: int
     interests: List[str]
 
+_TRIP_DETAILS_SCHEMA = TripDetails.model_json_schema()
+
+# Only the most recent messages are needed to pin down the trip details.
+EXTRACTION_HISTORY_MESSAGES = 20
+
+CHATBOT_SYSTEM_PROMPT = "You are a friendly travel assistant helping the user plan a trip: where they want to go, for how many days, and what they are interested in."
+
+# Once the conversation exceeds this many messages, the oldest half is dropped.
+# Trimming in one batch rather than per turn keeps the sent prefix identical
+# across most turns, so Ollama can reuse its KV cache for it.
+CHAT_HISTORY_MESSAGES = 40
+
 class Chatbot:
     def __init__(self, model_name="technobyte/c4ai-command-r7b-12-2024:Q5_K_M"):
         self.model_name = model_name
-        self.history = []
+        # The system message always stays at index 0 as the stable prompt prefix.
+        self.history = [{"role": "system", "content": CHATBOT_SYSTEM_PROMPT}]
 
     def add_message(self, role, content):
         self.history.append({"role": role, "content": content})
 
+    def trim_history(self):
+        """Drops the oldest user/assistant pairs once the history grows too long, keeping the system message."""
+        excess = len(self.history) - 1 - CHAT_HISTORY_MESSAGES
+        if excess > 0:
+            drop = excess + CHAT_HISTORY_MESSAGES // 2
+            drop += drop % 2
+            del self.history[1:1 + drop]
+
     def chat(self, user_message):
         self.add_message("user", user_message)
+        self.trim_history()
         try:
             response = ollama.chat(
                 model=self.model_name,
@@ -63,43 +95,97 @@ class Chatbot:
         
         The conversation:
         {conversation}
-
-        Provide the trip details in the following JSON format:
-        {
-            "destination": "<destination>",
-            "duration": <duration>,
-            "interests": ["<interest1>", "<interest2>", ...]
-        }
         """
 
-        conversation_text = "\n".join([msg["content"] for msg in self.history])
+        recent_history = self.history[1:][-EXTRACTION_HISTORY_MESSAGES:]
+        conversation_text = "\n".join([msg["content"] for msg in recent_history])
         formatted_prompt = prompt.format(conversation=conversation_text)
         
         try:
             response = ollama.chat(
                 model=self.model_name,
                 messages=[{"role": "user", "content": formatted_prompt}],
+                format=_TRIP_DETAILS_SCHEMA,
                 options={"temperature": 0.7}
             )
             response_message = response['message']['content']
             
-            trip_details = TripDetails.parse_raw(response_message)
+            trip_details = TripDetails.model_validate_json(response_message)
             return trip_details
         except Exception as e:
             raise RuntimeError(f"Error extracting trip details: {e}")
       
 
-def geocode_location(location_name):
-    """Uses the Geoapify API to retrieve latitude and longitude for a given location name."""
-    url = f"https://api.geoapify.com/v1/geocode/search?text={location_name}&apiKey={os.getenv('GEOAPIFY_API_KEY')}"
-    headers = CaseInsensitiveDict({"Accept": "application/json"})
+GEOAPIFY_URL = "https://api.geoapify.com/v1/geocode/search"
+GEOCODE_CACHE_TTL = 30 * 86400
+GEOCODE_MEMORY_CACHE_SIZE = 4096
+GEOCODE_CACHE_DIR = "./.geocache"
+
+_geocode_memory_cache = {}
+_geocode_disk_cache = None
+
+def _get_geocode_disk_cache():
+    """Opens the on-disk geocode cache on first use rather than at import."""
+    global _geocode_disk_cache
+    if _geocode_disk_cache is None:
+        _geocode_disk_cache = diskcache.Cache(GEOCODE_CACHE_DIR)
+    return _geocode_disk_cache
+
+def create_geoapify_client():
+    """Creates an HTTP client for Geoapify; share one across requests so connections are pooled."""
+    return httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=32),
+        headers={"Accept": "application/json"},
+        timeout=5,
+    )
+
+@contextlib.asynccontextmanager
+async def _clients(ollama_client=None, geoapify_client=None):
+    """Yields the given clients, creating any that weren't passed in and closing those afterwards."""
+    async with contextlib.AsyncExitStack() as stack:
+        if ollama_client is None:
+            ollama_client = ollama.AsyncClient()
+            stack.push_async_callback(ollama_client.close)
+        if geoapify_client is None:
+            geoapify_client = create_geoapify_client()
+            stack.push_async_callback(geoapify_client.aclose)
+        yield ollama_client, geoapify_client
+
+def _geocode_cache_key(location_name, destination):
+    return hashlib.blake2b(f"{location_name}|{destination}".lower().encode()).hexdigest()
+
+def _remember_geocode(key, coords):
+    if len(_geocode_memory_cache) >= GEOCODE_MEMORY_CACHE_SIZE:
+        _geocode_memory_cache.pop(next(iter(_geocode_memory_cache)))
+    _geocode_memory_cache[key] = coords
+
+async def geocode_location(client, location_name, destination):
+    """Uses the Geoapify API to retrieve latitude and longitude for a location in the destination.
+
+    Results are cached in memory and on disk, so repeated lookups skip the API call.
+    """
+    key = _geocode_cache_key(location_name, destination)
+    if key in _geocode_memory_cache:
+        return _geocode_memory_cache[key]
+    # diskcache is a blocking sqlite store, so keep it off the event loop.
+    cached = await asyncio.to_thread(_get_geocode_disk_cache().get, key)
+    if cached is not None:
+        coords = {"longitude": cached[0], "latitude": cached[1]}
+        _remember_geocode(key, coords)
+        return coords
+
+    params = {"text": f"{location_name} {destination}", "apiKey": os.getenv('GEOAPIFY_API_KEY')}
     try:
-        response = requests.get(url, headers=headers)
+        response = await client.get(GEOAPIFY_URL, params=params)
         if response.status_code == 200:
             data = response.json()
             if data.get("features"):
-                coords = data["features"][0]["geometry"]["coordinates"]
-                return {"longitude": coords[0], "latitude": coords[1]}
+                lon, lat = data["features"][0]["geometry"]["coordinates"][:2]
+                await asyncio.to_thread(_get_geocode_disk_cache().set, key, (lon, lat), expire=GEOCODE_CACHE_TTL)
+                coords = {"longitude": lon, "latitude": lat}
+                _remember_geocode(key, coords)
+                return coords
             else:
                 raise ValueError(f"No geocoding results found for {location_name}")
         else:
@@ -107,175 +193,130 @@ def geocode_location(location_name):
     except Exception as e:
         raise RuntimeError(f"Error during geocoding: {e}")
 
-def generate_itinerary(destination, duration, interests, additional_info):
-    """ Generates a detailed itinerary based on the destination, duration, interests, and additional information. """
+# Constant across requests so Ollama can reuse the cached prompt prefix.
+ITINERARY_SYSTEM_PROMPT = """You are a travel planner that writes engaging, highly-detailed itineraries.
+Each day should include around 4 ~ 5 diverse activities (e.g., museums, hands-on experiences, unique dining spots) that do not overlap with one another.
+For each activity, include:
+  - location_name: a specific store, landmark, restaurant, beach, or venue
+  - description: at least 50 characters with specific recommendations
+Example activity: {"location_name": "Nishiki Market", "description": "Explore Kyoto's famous food market. Try tako tamago and Kyoto-style sushi at Nishiki Sushi."}
+Follow the provided JSON schema strictly."""
+
+# Fixed pieces of the per-request prompt, joined around the request values.
+_PROMPT_HEAD = "Generate an itinerary for a trip to "
+_PROMPT_DURATION = " for exactly "
+_PROMPT_INTERESTS = " days.\nFocus on activities that align with these interests: "
+_PROMPT_TAIL = ".\n\nHere's some information you should keep in mind from other travelers for the itinerary generation:\n"
+
+async def generate_itinerary(destination, duration, interests, additional_info, ollama_client=None, geoapify_client=None):
+    """ Generates a detailed itinerary based on the destination, duration, interests, and additional information.
+
+    The model is expected to already be pulled; server.py does this once at startup.
+    """
     
-    prompt = f"""
-        Generate an engaging and highly-detailed itinerary for a trip to {destination} for {duration} days.
-        Focus on including a mix of activities that align with these specific interests: {', '.join(interests)}. Each day should include around 4 ~ 5 activities.
-        Make sure activities are diverse (e.g., museums, hands-on experiences, unique dining spots) and appealing to someone passionate about {', '.join(interests)}.
-        
-        For each activity, include:
-          - Location name (specific location address for the activity, such as a specific store, landmark, restaurant, beach, or venue)
-          - Detailed description (at least 50 characters) with specific recommendations
-                
-        Ensure the itinerary contains exactly {duration} days and the activities do not overlap with one another.
-        
-        Here is an example of the expected JSON format:
-
-        Example 1:
-        {{
-          "destination": "Japan",
-          "duration": 2,
-          "itinerary": [
-            {{
-              "day": 1,
-              "schedule": [
-                {{
-                  "location_name": "Tsukiji Outer Market",
-                  "description": "Start your day with a visit to the famous Tsukiji Outer Market. Try fresh sushi for breakfast at Sushi Dai, known for its excellent omakase.",
-              
-                }},
-                {{
-                  "location_name": "Ueno Park",
-                  "description": "Explore Ueno Park, home to several museums. Visit the Tokyo National Museum to learn about Japanese art and history.",
-                  
-                }},
-                {{
-                  "location_name": "Ameyoko Shopping Street",
-                  "description": "Experience the lively atmosphere of Ameyoko. Have lunch at Okonomiyaki Sometaro, a local favorite for Japanese savory pancakes.",
-                  
-                }},
-                {{
-                  "location_name": "Takeshita Street, Harajuku",
-                  "description": "Dive into Tokyo's youth culture on Takeshita Street. Shop for unique fashion items and try rainbow cotton candy.",
-                  
-                }},
-                {{
-                  "location_name": "Shibuya Crossing",
-                  "description": "Experience the famous Shibuya Crossing and visit the Hachiko statue. End your day with dinner at Ichiran Ramen Shibuya for delicious tonkotsu ramen.",
-                  
-                }}
-              "day": 2,
-              "schedule": [
-                {{
-                  "location_name": "Kiyomizu-dera Temple",
-                  "description": "Start your Kyoto journey at this UNESCO World Heritage site. Enjoy the panoramic views of Kyoto from the temple's wooden terrace.",
-                  
-                }},
-                {{
-                  "location_name": "Ginkaku-ji (Silver Pavilion)",
-                  "description": "Explore this Zen temple known for its beautiful sand garden and moss garden. Take a stroll along the Philosopher's Path.",
-                  
-                }},
-                {{
-                  "location_name": "Nanzenji Temple",
-                  "description": "Visit this important Zen temple complex. Don't miss the massive San-mon gate and the unique aqueduct on the temple grounds.",
-                  
-                }},
-                {{
-                  "location_name": "Nishiki Market",
-                  "description": "Explore Kyoto's famous food market. Have a late lunch trying various local delicacies like tako tamago and Kyoto-style sushi at Nishiki Sushi.",
-                  
-                }},
-                {{
-                  "location_name": "Pontocho Alley",
-                  "description": "End your day with a dinner at Izusen for traditional Kyoto cuisine (kaiseki) while enjoying the atmospheric narrow alley lined with traditional buildings.",
-                  
-                }}
-              ]
-            }}
-          ]
-        }}
-
-    Return the result as a JSON object with the following structure:
-    {{
-        "destination": "{destination}",
-        "duration": {duration},
-        "itinerary": [
-            {{
-                "day": 1,
-                "schedule": [
-                    {{
-                        "location_name": str,
-                        "description": str,
-                      
-                    }},
-                    ...
-                  continue this format for each of the days in the schedule.
-                ]
-            }},
-            ...
-        ]
-    }}
-    Ensure that the itinerary contains exactly {duration} days.
-
-    Here's some information you should keep in mind from other travelers for the itinerary generation: 
-    {additional_info}
-    """ 
-
-    # model_name = 'cnmoro/arcee-lite:q4_k_m'
-    model_name = 'technobyte/c4ai-command-r7b-12-2024:Q5_K_M'
+    prompt = "".join([
+        _PROMPT_HEAD, destination,
+        _PROMPT_DURATION, str(duration),
+        _PROMPT_INTERESTS, ", ".join(interests),
+        _PROMPT_TAIL, additional_info,
+    ])
+
     try:
-        # NOT TESTED for docker ollama, otherwise install ollama and run before running this code
-
-        # url = "http://localhost:11434/api/v1/generate" 
-        # headers = {"Content-Type": "application/json"}
-        # payload = {
-        #     "model": "technobyte/c4ai-command-r7b-12-2024:Q5_K_M",
-        #     "prompt": prompt,
-        #     "format": Itinerary.model_json_schema(),
-        #     "options": {"temperature": 0.7}
-        # }
-
-        # response = requests.post(url, headers=headers, json=payload)
-        # response.raise_for_status()
-        # content = response.json()
-
-        # itinerary_json = content.get("output")
-        # itinerary = Itinerary.model_validate_json(itinerary_json)
-
-        ollama.pull(model_name)
-        print("Model pulled")
-
-        response = ollama.chat(
-            model=model_name,
-            messages=[{'role': 'user', 'content': prompt}],
-            format=Itinerary.model_json_schema(),
-            options={"temperature": 0.7}
-        )   
-        print("response", response['message']['content'])
-        itinerary = Itinerary.model_validate_json(response['message']['content'])
-        
-        for day in itinerary.itinerary:
-            for activity in day.schedule:
-                coords = geocode_location(activity.location_name + " " + destination)
-                activity.longitude = coords["longitude"]
-                activity.latitude = coords["latitude"]
+        async with _clients(ollama_client, geoapify_client) as (ollama_client, geoapify_client):
+            # NOT TESTED for docker ollama, otherwise install ollama and run before running this code
+
+            # url = "http://localhost:11434/api/v1/generate" 
+            # headers = {"Content-Type": "application/json"}
+            # payload = {
+            #     "model": "technobyte/c4ai-command-r7b-12-2024:Q5_K_M",
+            #     "prompt": prompt,
+            #     "format": Itinerary.model_json_schema(),
+            #     "options": {"temperature": 0.7}
+            # }
+
+            # response = requests.post(url, headers=headers, json=payload)
+            # response.raise_for_status()
+            # content = response.json()
+
+            # itinerary_json = content.get("output")
+            # itinerary = Itinerary.model_validate_json(itinerary_json)
+
+            # Stream the response and start geocoding each activity as soon as the
+            # parser has seen it, so lookups overlap with the rest of generation.
+            streamed_activities = ijson.sendable_list()
+            parser = ijson.items_coro(streamed_activities, "itinerary.item.schedule.item")
+            # One task per distinct location name, so repeats are only looked up once.
+            geocode_tasks = {}
+            chunks = []
+            try:
+                stream = await ollama_client.chat(
+                    model=MODEL_NAME,
+                    messages=[
+                        {'role': 'system', 'content': ITINERARY_SYSTEM_PROMPT},
+                        {'role': 'user', 'content': prompt},
+                    ],
+                    format=_ITINERARY_SCHEMA,
+                    options={"temperature": 0.7},
+                    stream=True,
+                )
+                async for part in stream:
+                    chunk = part['message']['content']
+                    # ijson treats an empty send as end of input, and Ollama's final
+                    # done=True part always carries empty content.
+                    if not chunk:
+                        continue
+                    chunks.append(chunk)
+                    parser.send(chunk.encode())
+                    for activity in streamed_activities:
+                        name = activity["location_name"]
+                        if name not in geocode_tasks:
+                            geocode_tasks[name] = asyncio.create_task(geocode_location(geoapify_client, name, destination))
+                    del streamed_activities[:]
+                parser.close()
+
+                content = "".join(chunks)
+                print("response", content)
+                # A single pydantic-core pass; much cheaper than json parsing plus jsonschema.
+                itinerary = Itinerary.model_validate_json(content)
+                coords_by_name = dict(zip(geocode_tasks, await asyncio.gather(*geocode_tasks.values())))
+            finally:
+                for task in geocode_tasks.values():
+                    task.cancel()
+                # Collect outcomes so failed lookups don't log "Task exception was never retrieved".
+                await asyncio.gather(*geocode_tasks.values(), return_exceptions=True)
+
+            for day in itinerary.itinerary:
+                for activity in day.schedule:
+                    coords = coords_by_name[activity.location_name]
+                    activity.longitude = coords["longitude"]
+                    activity.latitude = coords["latitude"]
         
-        return itinerary.model_dump()
+            return itinerary.model_dump()
     
     except Exception as e:
         raise RuntimeError(f"Error generating itinerary: {e}")
 
 def save_itinerary_to_file(itinerary, filename):
     try:
-        itinerary_dict = itinerary.dict() if isinstance(itinerary, BaseModel) else itinerary
-        with open(filename, 'w') as file:
-            json.dump(itinerary_dict, file, indent=2)
+        itinerary_dict = itinerary.model_dump(mode='json') if isinstance(itinerary, BaseModel) else itinerary
+        with open(filename, 'wb') as file:
+            file.write(orjson.dumps(itinerary_dict, option=orjson.OPT_INDENT_2))
         print(f"Itinerary saved to {filename}")
     except Exception as e:
         raise RuntimeError(f"Error saving itinerary to file: {e}")
 
 
-async def process_reddit_and_generate_itinerary(destination, duration, interests):
-    reddit = RedditSummarizer()
-    await reddit.initialize()
-    reddit_additional_info = await reddit.process_search_and_summarize(
-        location=destination,
-        interests=interests
-    )
-    return generate_itinerary(destination, duration, interests, reddit_additional_info)
+async def process_reddit_and_generate_itinerary(destination, duration, interests, ollama_client=None, geoapify_client=None):
+    async with _clients(ollama_client, geoapify_client) as (ollama_client, geoapify_client):
+        reddit = RedditSummarizer(ollama_client)
+        await reddit.initialize()
+        reddit_additional_info = await reddit.process_search_and_summarize(
+            location=destination,
+            interests=interests
+        )
+        return await generate_itinerary(
+            destination, duration, interests, reddit_additional_info, ollama_client, geoapify_client
+        )
 
 
 """
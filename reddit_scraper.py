@@ -1,9 +1,10 @@
+import asyncio
 import asyncpraw
 import os
+import time
 from dotenv import load_dotenv
 import ollama
-from pydantic import BaseModel, Field
-import json
+from pydantic import BaseModel, ConfigDict, Field
 
 load_dotenv()
 
@@ -13,12 +14,25 @@ class ItineraryRequest(BaseModel):
     interests: list[str]
 
 class LocationSummary(BaseModel):
+    model_config = ConfigDict(cache_strings="keys")
+
     location: str = Field(..., description="The name of the location.")
     description: str = Field(..., description="A brief description of what the location offers.")
 
+_LOCSUM_SCHEMA = LocationSummary.model_json_schema()
+
+SUMMARY_CACHE_TTL = 6 * 3600
+SUMMARY_CONCURRENCY = 4
+
 class RedditSummarizer:
-    def __init__(self):
+    # Combined summaries keyed by search parameters, shared across instances
+    # since a new summarizer is created for every itinerary request.
+    _summary_cache = {}
+
+    def __init__(self, ollama_client=None):
         self.reddit = None
+        # One client per summarizer so concurrent summaries share a connection pool.
+        self.ollama_client = ollama_client or ollama.AsyncClient()
 
     async def initialize(self):
         """Initializes the Reddit instance asynchronously."""
@@ -49,8 +63,7 @@ class RedditSummarizer:
         """Extracts text from a Reddit post."""
         return post.selftext if post.selftext else post.title
 
-    @staticmethod
-    def summarize_text_with_llm(text: str, model_name="cnmoro/arcee-lite:q4_k_m"):
+    async def summarize_text_with_llm(self, text: str, model_name="cnmoro/arcee-lite:q4_k_m"):
         """Summarizes text using the LLM with grammar constraints."""
         prompt = f"""
             Extract and summarize locations and key points from the text below. Provide the output as a list of objects with 'location' and 'description' fields:
@@ -58,36 +71,64 @@ class RedditSummarizer:
             {text}
         """
         try:
-            response = ollama.chat(
+            response = await self.ollama_client.chat(
                 model=model_name,
                 messages=[{"role": "user", "content": prompt}],
-                format=LocationSummary.model_json_schema(),
+                format=_LOCSUM_SCHEMA,
                 options={"temperature": 0.7},
             )
             return response['message']['content']
         except Exception as e:
             raise RuntimeError(f"Error summarizing text: {e}")
 
+    async def summarize_post(self, post):
+        """Summarizes a single Reddit post, returning None if it has no text to summarize."""
+        text = self.extract_text_from_reddit_post(post)
+        if not text:
+            print(f"No text extracted from post '{post.title}'")
+            return None
+        try:
+            summary_json = await self.summarize_text_with_llm(text)
+            return LocationSummary.model_validate_json(summary_json)
+        except Exception as e:
+            raise RuntimeError(f"Error summarizing post '{post.title}': {e}")
+
     async def process_search_and_summarize(self, location: str, interests: list[str], subreddit="travel", max_results=5) -> str:
-        """Searches Reddit and summarizes results."""
+        """Searches Reddit and summarizes results, reusing recent results for the same search."""
+        cache_key = (
+            location.lower(),
+            tuple(sorted(interest.lower() for interest in interests)),
+            subreddit,
+            max_results,
+        )
+        cached = self._summary_cache.get(cache_key)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
         query = self.construct_query(location, interests)
         posts = await self.search_reddit_itineraries(query, subreddit, max_results)
 
-        all_summaries = []
-        for post in posts:
-            text = self.extract_text_from_reddit_post(post)
-            if text:
-                try:
-                    summary_json = self.summarize_text_with_llm(text)
-                    summary_dict = json.loads(summary_json)
-                    summary = LocationSummary(**summary_dict)
-                    all_summaries.append(summary)
-                except Exception as e:
-                    print(f"Error summarizing post '{post.title}': {e}")
-            else:
-                print(f"No text extracted from post '{post.title}'")
+        # Search listings already carry selftext, so posts need no extra load()
+        # round-trip; just cap how many summaries hit Ollama at once.
+        semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+
+        async def summarize_bounded(post):
+            async with semaphore:
+                return await self.summarize_post(post)
+
+        results = await asyncio.gather(*[summarize_bounded(post) for post in posts], return_exceptions=True)
+        failures = [result for result in results if isinstance(result, Exception)]
+        for failure in failures:
+            print(failure)
+        all_summaries = [result for result in results if isinstance(result, LocationSummary)]
 
         combined_summaries = "\n".join(
             f"- {item.location}: {item.description}" for item in all_summaries
         )
+        # Don't let a transient Ollama failure pin a partial summary for the whole TTL.
+        if not failures:
+            now = time.monotonic()
+            for key in [key for key, (expires_at, _) in self._summary_cache.items() if expires_at <= now]:
+                del self._summary_cache[key]
+            self._summary_cache[cache_key] = (now + SUMMARY_CACHE_TTL, combined_summaries)
         return combined_summaries
\ No newline at end of file
@@ -1,17 +1,32 @@
+import asyncio
+import hashlib
 import os
+import time
+from contextlib import asynccontextmanager
+import ollama
+import orjson
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from typing import List
 from ollam import (
+    MODEL_NAME,
+    create_geoapify_client,
     process_reddit_and_generate_itinerary,
     save_itinerary_to_file,
     Itinerary,
 )
 
-app = FastAPI()
-
 PORT = 8001
 
+PREWARM_ATTEMPTS = 5
+PREWARM_RETRY_DELAY = 5
+
+ITINERARY_CACHE_TTL = 3600
+ITINERARY_CACHE_SIZE = 256
+
+# Generated itineraries keyed by a hash of the normalized request.
+itinerary_cache = {}
+
 class ItineraryRequest(BaseModel):
     destination: str
     duration: int
@@ -21,17 +36,71 @@ class SaveRequest(BaseModel):
     itinerary: Itinerary
     filename: str
 
-@app.post("/generate-itinerary/")
+async def prewarm_model(ollama_client):
+    """
+    Pull the itinerary model once and load it into memory so requests don't pay for it.
+    Failures are retried and logged rather than raised, since Ollama may still be starting.
+    """
+    for attempt in range(1, PREWARM_ATTEMPTS + 1):
+        try:
+            await ollama_client.pull(MODEL_NAME)
+            # A chat with no messages loads the model weights without generating anything.
+            await ollama_client.chat(model=MODEL_NAME, messages=[])
+            return
+        except Exception as e:
+            print(f"Error prewarming model {MODEL_NAME} (attempt {attempt}/{PREWARM_ATTEMPTS}): {e}")
+            if attempt < PREWARM_ATTEMPTS:
+                await asyncio.sleep(PREWARM_RETRY_DELAY * attempt)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.ollama_client = ollama.AsyncClient()
+    app.state.geoapify_client = create_geoapify_client()
+    # Prewarm in the background so the API still starts if Ollama isn't up yet.
+    prewarm = asyncio.create_task(prewarm_model(app.state.ollama_client))
+    try:
+        yield
+    finally:
+        prewarm.cancel()
+        await asyncio.gather(prewarm, return_exceptions=True)
+        await app.state.geoapify_client.aclose()
+        await app.state.ollama_client.close()
+
+app = FastAPI(lifespan=lifespan)
+
+def itinerary_cache_key(request: ItineraryRequest) -> str:
+    payload = {
+        "d": request.destination.lower(),
+        "n": request.duration,
+        "i": sorted(interest.lower() for interest in request.interests),
+    }
+    return hashlib.blake2b(orjson.dumps(payload)).hexdigest()
+
+@app.post("/generate-itinerary/", response_model=Itinerary)
 async def generate_itinerary(request: ItineraryRequest):
     """
     Generate an itinerary based on the provided destination, duration, and interests.
+    Identical requests within ITINERARY_CACHE_TTL seconds are served from cache.
     """
+    cache_key = itinerary_cache_key(request)
+    cached = itinerary_cache.get(cache_key)
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+
     try:
         itinerary = await process_reddit_and_generate_itinerary(
             destination=request.destination,
             duration=request.duration,
             interests=request.interests,
+            ollama_client=app.state.ollama_client,
+            geoapify_client=app.state.geoapify_client,
         )
+        now = time.monotonic()
+        for key in [key for key, (expires_at, _) in itinerary_cache.items() if expires_at <= now]:
+            del itinerary_cache[key]
+        if len(itinerary_cache) >= ITINERARY_CACHE_SIZE:
+            itinerary_cache.pop(next(iter(itinerary_cache)))
+        itinerary_cache[cache_key] = (now + ITINERARY_CACHE_TTL, itinerary)
         return itinerary
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating itinerary: {str(e)}")
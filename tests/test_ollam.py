@@ -0,0 +1,160 @@
+import asyncio
+import json
+
+import ollam
+
+
+ITINERARY = {
+    "destination": "Japan",
+    "trip_duration": 1,
+    "itinerary": [
+        {
+            "day": 1,
+            "schedule": [
+                {
+                    "location_name": "Nishiki Market",
+                    "description": "Explore Kyoto's famous food market and try tako tamago at the stalls.",
+                },
+                {
+                    "location_name": "Pontocho Alley",
+                    "description": "End the day with a kaiseki dinner along this atmospheric narrow alley.",
+                },
+                {
+                    "location_name": "Nishiki Market",
+                    "description": "Come back for a late snack of Kyoto-style sushi at Nishiki Sushi.",
+                },
+            ],
+        }
+    ],
+}
+
+
+class FakeOllamaClient:
+    """Streams a fixed response the way Ollama does, ending with an empty done=True part."""
+
+    def __init__(self, content, chunk_size=17):
+        self.parts = [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)]
+
+    async def chat(self, **kwargs):
+        async def stream():
+            for part in self.parts:
+                yield {"message": {"content": part}, "done": False}
+            yield {"message": {"content": ""}, "done": True}
+        return stream()
+
+
+def test_generate_itinerary_handles_empty_final_chunk(monkeypatch):
+    coords = {
+        "Nishiki Market": {"longitude": 135.76, "latitude": 35.00},
+        "Pontocho Alley": {"longitude": 135.77, "latitude": 35.01},
+    }
+    lookups = []
+
+    async def fake_geocode(client, location_name, destination):
+        lookups.append(location_name)
+        return coords[location_name]
+
+    monkeypatch.setattr(ollam, "geocode_location", fake_geocode)
+    client = FakeOllamaClient(json.dumps(ITINERARY))
+
+    itinerary = asyncio.run(ollam.generate_itinerary("Japan", 1, ["food"], "", client))
+
+    schedule = itinerary["itinerary"][0]["schedule"]
+    assert [activity["longitude"] for activity in schedule] == [135.76, 135.77, 135.76]
+    assert [activity["latitude"] for activity in schedule] == [35.00, 35.01, 35.00]
+    assert sorted(lookups) == ["Nishiki Market", "Pontocho Alley"]
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, coordinates):
+        self.coordinates = coordinates
+
+    def json(self):
+        return {"features": [{"geometry": {"coordinates": self.coordinates}}]}
+
+
+class FakeGeoapifyClient:
+    def __init__(self):
+        self.queries = []
+
+    async def get(self, url, params):
+        self.queries.append(params["text"])
+        return FakeResponse([135.76, 35.00])
+
+
+def isolate_geocode_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(ollam, "_geocode_memory_cache", {})
+    monkeypatch.setattr(ollam, "_geocode_disk_cache", None)
+    monkeypatch.setattr(ollam, "GEOCODE_CACHE_DIR", str(tmp_path))
+
+
+def test_geocode_location_caches_in_memory(monkeypatch, tmp_path):
+    isolate_geocode_cache(monkeypatch, tmp_path)
+    client = FakeGeoapifyClient()
+
+    async def lookup_twice():
+        first = await ollam.geocode_location(client, "Nishiki Market", "Japan")
+        second = await ollam.geocode_location(client, "nishiki market", "JAPAN")
+        return first, second
+
+    first, second = asyncio.run(lookup_twice())
+
+    assert first == second == {"longitude": 135.76, "latitude": 35.00}
+    assert client.queries == ["Nishiki Market Japan"]
+
+
+def test_geocode_location_falls_back_to_disk_cache(monkeypatch, tmp_path):
+    isolate_geocode_cache(monkeypatch, tmp_path)
+    client = FakeGeoapifyClient()
+    asyncio.run(ollam.geocode_location(client, "Nishiki Market", "Japan"))
+
+    # A fresh process only has the on-disk tier.
+    monkeypatch.setattr(ollam, "_geocode_memory_cache", {})
+    coords = asyncio.run(ollam.geocode_location(client, "Nishiki Market", "Japan"))
+
+    assert coords == {"longitude": 135.76, "latitude": 35.00}
+    assert client.queries == ["Nishiki Market Japan"]
+    assert len(ollam._geocode_memory_cache) == 1
+
+
+def test_geocode_memory_cache_is_bounded(monkeypatch, tmp_path):
+    isolate_geocode_cache(monkeypatch, tmp_path)
+    monkeypatch.setattr(ollam, "GEOCODE_MEMORY_CACHE_SIZE", 2)
+    client = FakeGeoapifyClient()
+
+    async def lookup_all():
+        for name in ["A", "B", "C"]:
+            await ollam.geocode_location(client, name, "Japan")
+
+    asyncio.run(lookup_all())
+
+    assert len(ollam._geocode_memory_cache) == 2
+    assert ollam._geocode_cache_key("A", "Japan") not in ollam._geocode_memory_cache
+
+
+def test_chatbot_trim_keeps_system_prefix_and_alternation(monkeypatch):
+    sent_sizes = []
+
+    def fake_chat(model, messages, options):
+        sent_sizes.append(len(messages) - 1)
+        return {"message": {"content": f"reply {len(sent_sizes)}"}}
+
+    monkeypatch.setattr(ollam.ollama, "chat", fake_chat)
+    chatbot = ollam.Chatbot()
+
+    for turn in range(ollam.CHAT_HISTORY_MESSAGES):
+        chatbot.chat(f"message {turn}")
+
+    assert chatbot.history[0] == {"role": "system", "content": ollam.CHATBOT_SYSTEM_PROMPT}
+    roles = [message["role"] for message in chatbot.history[1:]]
+    assert roles == ["user", "assistant"] * (len(roles) // 2)
+    assert chatbot.history[-2]["content"] == f"message {ollam.CHAT_HISTORY_MESSAGES - 1}"
+
+    # The first trim drops the sent history back to about half the window,
+    # after which it grows again one exchange at a time.
+    assert max(sent_sizes) <= ollam.CHAT_HISTORY_MESSAGES
+    trim = next(i for i in range(1, len(sent_sizes)) if sent_sizes[i] < sent_sizes[i - 1])
+    assert abs(sent_sizes[trim] - ollam.CHAT_HISTORY_MESSAGES // 2) <= 1
+    assert sent_sizes[trim + 1] == sent_sizes[trim] + 2
@@ -0,0 +1,64 @@
+import asyncio
+from types import SimpleNamespace
+
+import reddit_scraper
+from reddit_scraper import RedditSummarizer
+
+
+POSTS = [
+    SimpleNamespace(title="Two weeks in Japan", selftext="Day 1 at Nishiki Market..."),
+    SimpleNamespace(title="Kyoto food tips", selftext="Try Pontocho Alley at night..."),
+]
+
+
+def make_summarizer(monkeypatch, summarize):
+    monkeypatch.setattr(RedditSummarizer, "_summary_cache", {})
+    summarizer = RedditSummarizer(ollama_client=object())
+    searches = []
+
+    async def fake_search(query, subreddit="travel", max_results=5):
+        searches.append(query)
+        return POSTS
+
+    monkeypatch.setattr(summarizer, "search_reddit_itineraries", fake_search)
+    monkeypatch.setattr(summarizer, "summarize_text_with_llm", summarize)
+    return summarizer, searches
+
+
+async def summarize_ok(text):
+    return '{"location": "Kyoto", "description": "%s"}' % text
+
+
+def test_summaries_are_cached_per_normalized_search(monkeypatch):
+    summarizer, searches = make_summarizer(monkeypatch, summarize_ok)
+
+    first = asyncio.run(summarizer.process_search_and_summarize("Japan", ["history", "food"]))
+    second = asyncio.run(summarizer.process_search_and_summarize("japan", ["Food", "History"]))
+
+    assert first == second == "- Kyoto: Day 1 at Nishiki Market...\n- Kyoto: Try Pontocho Alley at night..."
+    assert len(searches) == 1
+
+
+def test_cached_summaries_expire(monkeypatch):
+    summarizer, searches = make_summarizer(monkeypatch, summarize_ok)
+    now = [1000.0]
+    monkeypatch.setattr(reddit_scraper.time, "monotonic", lambda: now[0])
+
+    asyncio.run(summarizer.process_search_and_summarize("Japan", ["food"]))
+    now[0] += reddit_scraper.SUMMARY_CACHE_TTL + 1
+    asyncio.run(summarizer.process_search_and_summarize("Japan", ["food"]))
+
+    assert len(searches) == 2
+
+
+def test_failed_summaries_are_not_cached(monkeypatch):
+    async def summarize_down(text):
+        raise RuntimeError("Ollama is unreachable")
+
+    summarizer, searches = make_summarizer(monkeypatch, summarize_down)
+
+    assert asyncio.run(summarizer.process_search_and_summarize("Japan", ["food"])) == ""
+    assert RedditSummarizer._summary_cache == {}
+
+    asyncio.run(summarizer.process_search_and_summarize("Japan", ["food"]))
+    assert len(searches) == 2
@@ -0,0 +1,63 @@
+import asyncio
+
+import server
+from server import ItineraryRequest
+
+
+def make_endpoint(monkeypatch):
+    monkeypatch.setattr(server, "itinerary_cache", {})
+    monkeypatch.setattr(server.app.state, "ollama_client", None, raising=False)
+    monkeypatch.setattr(server.app.state, "geoapify_client", None, raising=False)
+    calls = []
+
+    async def fake_generate(destination, duration, interests, ollama_client, geoapify_client):
+        calls.append(destination)
+        return {"destination": destination, "trip_duration": duration, "itinerary": []}
+
+    monkeypatch.setattr(server, "process_reddit_and_generate_itinerary", fake_generate)
+    return calls
+
+
+def request(destination="Japan", duration=3, interests=("food", "history")):
+    return ItineraryRequest(destination=destination, duration=duration, interests=list(interests))
+
+
+def test_cache_key_ignores_case_and_interest_order():
+    key = server.itinerary_cache_key(request("Japan", 3, ["Food", "history"]))
+
+    assert key == server.itinerary_cache_key(request("JAPAN", 3, ["History", "food"]))
+    assert key != server.itinerary_cache_key(request("Japan", 4, ["food", "history"]))
+    assert key != server.itinerary_cache_key(request("Japan", 3, ["food"]))
+
+
+def test_identical_requests_are_served_from_cache(monkeypatch):
+    calls = make_endpoint(monkeypatch)
+
+    first = asyncio.run(server.generate_itinerary(request("Japan", 3, ["food", "history"])))
+    second = asyncio.run(server.generate_itinerary(request("japan", 3, ["History", "Food"])))
+
+    assert first == second
+    assert calls == ["Japan"]
+
+
+def test_cached_itineraries_expire(monkeypatch):
+    calls = make_endpoint(monkeypatch)
+    now = [1000.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: now[0])
+
+    asyncio.run(server.generate_itinerary(request()))
+    now[0] += server.ITINERARY_CACHE_TTL + 1
+    asyncio.run(server.generate_itinerary(request()))
+
+    assert len(calls) == 2
+
+
+def test_itinerary_cache_is_bounded(monkeypatch):
+    make_endpoint(monkeypatch)
+    monkeypatch.setattr(server, "ITINERARY_CACHE_SIZE", 2)
+
+    for destination in ["Japan", "France", "Peru"]:
+        asyncio.run(server.generate_itinerary(request(destination)))
+
+    assert len(server.itinerary_cache) == 2
+    assert server.itinerary_cache_key(request("Japan")) not in server.itinerary_cache